@@ -9,9 +9,10 @@ Secciones:
 5) Descarga de resultados (CSV)
 
 Decisiones:
-- Algoritmos estándar de hashlib para despliegue 100% web.
+- Algoritmos estándar de hashlib para despliegue 100% web (+ BLAKE3 si está instalado).
 - Pepper y HMAC key se toman de st.secrets si existen (no se exponen).
 - Límite de archivo 10 MB por defecto para evitar timeouts/memoria.
+- El hash de archivo corre en un hilo (ThreadPoolExecutor) y un st.fragment sondea su progreso.
 
 Mejoras posibles:
 - Arrastrar/soltar múltiples archivos.
@@ -19,9 +20,9 @@ Mejoras posibles:
 - Persistencia en base de datos y logs con auditoría.
 """
 
-import io
-import csv
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Optional
 
 import streamlit as st
 from hash_utils import (
@@ -34,23 +35,77 @@ from hash_utils import (
 )
 
 # --------- Configuración inicial de la página ---------
+# Título con los algoritmos disponibles (incluye BLAKE3 si está instalado):
+ALGOS_TITLE = "/".join("BLAKE2b" if a == "blake2b" else a.upper() for a in SUPPORTED_ALGOS)
+
 st.set_page_config(
-    page_title="Hash Demo — SHA256/SHA1/SHA512/BLAKE2b",
+    page_title=f"Hash Demo — {ALGOS_TITLE}",
     page_icon="🧩",
     layout="wide",
 )
 
-st.title("🧩 Demo Didáctica de Hash — SHA256/SHA1/SHA512/BLAKE2b")
+st.title(f"🧩 Demo Didáctica de Hash — {ALGOS_TITLE}")
 st.caption("Integridad, salting, peppering y HMAC — 100% web con Streamlit Cloud")
 
 # --------- Estado para resultados a descargar ---------
-if "results" not in st.session_state:
-    st.session_state["results"] = []  # lista de dicts
+CSV_FIELDS = (
+    "ts",
+    "type",
+    "algorithm",
+    "with_salt",
+    "salt_hex",
+    "with_pepper",
+    "hmac",
+    "input_preview",
+    "digest",
+    "bytes",
+)
+_CSV_SPECIAL = frozenset(',"\r\n')
+
+# Resultados en columnas: una lista por campo, todas de la misma longitud
+# (sin un dict por fila → menos memoria y serialización con zip en C).
+if "results_cols" not in st.session_state:
+    st.session_state["results_cols"] = {field: [] for field in CSV_FIELDS}
+if "csv_buf" not in st.session_state:
+    st.session_state["csv_buf"] = bytearray()  # CSV ya serializado (bytes UTF-8)
+    st.session_state["csv_len"] = 0  # nº de resultados ya escritos en csv_buf
+
+
+def _csv_quote(value) -> str:
+    """Quoting mínimo estilo csv.QUOTE_MINIMAL (solo input_preview suele necesitarlo)."""
+    text = str(value)
+    if _CSV_SPECIAL.isdisjoint(text):
+        return text
+    return '"' + text.replace('"', '""') + '"'
+
+
+_CSV_HEADER = (",".join(CSV_FIELDS) + "\r\n").encode("utf-8")
+
+
+def _csv_rows(cols, start: int = 0) -> bytes:
+    """Serializa las filas [start:] de los resultados en columnas (un join, un encode)."""
+    rows = zip(*(cols[field][start:] for field in CSV_FIELDS))
+    return "".join(",".join(map(_csv_quote, row)) + "\r\n" for row in rows).encode("utf-8")
+
+
+def append_result(meta: dict) -> None:
+    """Añade un resultado (dict con los CSV_FIELDS) a las columnas de la sesión."""
+    cols = st.session_state["results_cols"]
+    for field in CSV_FIELDS:
+        cols[field].append(meta.get(field, ""))
+
+
+def algo_label(algo: str) -> str:
+    # blake3 solo aparece si el paquete opcional está instalado.
+    return f"{algo} (más rápido)" if algo == "blake3" else algo
 
 # --------- Sidebar: opciones globales ---------
 st.sidebar.header("Opciones")
 algorithm = st.sidebar.selectbox(
-    "Algoritmo", options=SUPPORTED_ALGOS, index=SUPPORTED_ALGOS.index("sha256")
+    "Algoritmo",
+    options=SUPPORTED_ALGOS,
+    index=SUPPORTED_ALGOS.index("sha256"),
+    format_func=algo_label,
 )
 chunk_size = st.sidebar.number_input("Chunk (bytes)", min_value=1024, max_value=65536, value=8192, step=1024)
 size_limit_mb = st.sidebar.number_input("Límite archivo (MB)", min_value=1, max_value=100, value=10)
@@ -84,9 +139,55 @@ def get_hmac_key_bytes():
         return None
     return str(val).encode("utf-8")
 
+_UTC_ISO_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+
+def utc_iso() -> str:
+    # datetime.utcnow() está obsoleto desde Python 3.12; formato fijo con microsegundos.
+    return datetime.now(timezone.utc).strftime(_UTC_ISO_FORMAT)
+
+_WHITESPACE_TO_SPACE = str.maketrans({"\n": " ", "\r": " ", "\t": " "})
+
+def input_preview(text: str, limit: int = 30) -> str:
+    # Un único slice + translate (más barato que encadenar .replace); el tamaño
+    # en bytes lo devuelven hash_text/hmac_text, no hace falta codificar aquí.
+    preview = text[:limit].translate(_WHITESPACE_TO_SPACE)
+    return preview + "..." if len(text) > limit else preview
+
 pepper_bytes = get_pepper_bytes() if use_pepper else None
 hmac_key_bytes = get_hmac_key_bytes() if use_hmac else None
 
+# --------- Memoización de hashes (reruns y entradas repetidas) ---------
+@st.cache_data(show_spinner=False, max_entries=256, ttl=3600)
+def cached_hash_text(
+    text: str,
+    algorithm: str,
+    salt: Optional[bytes],
+    pepper: Optional[bytes],
+):
+    return hash_text(text=text, algorithm=algorithm, salt=salt, pepper=pepper)
+
+# Hash de archivo: memo propio en session_state (no st.cache_data), porque el
+# cálculo corre en un hilo del pool sin ScriptRunContext y ahí cache_data no
+# lee ni escribe. La clave usa el file_id de la subida (no el contenido) para no
+# leer el archivo completo solo para calcularla; se consulta antes de enviar el
+# trabajo y se rellena en el hilo del script al consumir el resultado. Solo se
+# usa sin sal (con sal aleatoria por archivo nunca habría aciertos).
+FILE_HASH_MEMO_MAX = 64
+FILE_JOB_POLL_SECONDS = 0.1  # intervalo de sondeo del hash en segundo plano
+if "file_hash_memo" not in st.session_state:
+    st.session_state["file_hash_memo"] = {}  # clave -> (digest, salt, total_bytes)
+
+def remember_file_hash(key: tuple, result: tuple) -> None:
+    memo = st.session_state["file_hash_memo"]
+    memo[key] = result
+    while len(memo) > FILE_HASH_MEMO_MAX:
+        del memo[next(iter(memo))]  # descarta la entrada más antigua
+
+@st.cache_resource
+def get_hash_executor() -> ThreadPoolExecutor:
+    # Un único pool por proceso (cache_resource), compartido entre sesiones.
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="hash")
+
 if use_pepper and pepper_bytes is None:
     st.sidebar.warning("PEPPER no está configurado en `st.secrets`.")
 if use_hmac and hmac_key_bytes is None:
@@ -99,8 +200,17 @@ with col1:
     text_input = st.text_area("Introduce texto", value="", height=140, placeholder="Escribe aquí...")
 with col2:
     st.write("Opciones de sal/pepper")
-    current_salt = generate_salt(salt_len) if use_salt else None
+    # La sal se genera una vez y se conserva entre reruns (misma sal mostrada y
+    # usada); se renueva al cambiar la longitud, al pulsarse "Regenerar sal"
+    # o tras usarla en un hash.
+    current_salt = None
     if use_salt:
+        regenerate = st.button("Regenerar sal", use_container_width=True)
+        pending_salt = st.session_state.get("pending_salt")
+        if regenerate or pending_salt is None or len(pending_salt) != salt_len:
+            pending_salt = generate_salt(salt_len)
+            st.session_state["pending_salt"] = pending_salt
+        current_salt = pending_salt
         st.code(current_salt.hex(), language="text")
         st.caption("Sal generada (hex). Se comparte junto al hash para verificación.")
 
@@ -109,12 +219,13 @@ if st.button("Hashear texto", type="primary", use_container_width=True):
         st.error("Introduce algún texto.")
     else:
         try:
-            hex_digest, salt_used = hash_text(
+            hex_digest, salt_used, total_bytes = cached_hash_text(
                 text=text_input,
                 algorithm=algorithm,
                 salt=current_salt,
                 pepper=pepper_bytes,
             )
+            st.session_state["pending_salt"] = None  # una sal nueva por hash
             st.success("Hash calculado")
             st.code(hex_digest, language="text")
             meta = {
@@ -124,12 +235,12 @@ if st.button("Hashear texto", type="primary", use_container_width=True):
                 "salt_hex": salt_used.hex() if salt_used else "",
                 "with_pepper": bool(pepper_bytes),
                 "hmac": "",
-                "input_preview": text_input[:30].replace("\n", " ") + ("..." if len(text_input) > 30 else ""),
+                "input_preview": input_preview(text_input),
                 "digest": hex_digest,
-                "bytes": len(text_input.encode("utf-8")),
-                "ts": datetime.utcnow().isoformat() + "Z",
+                "bytes": total_bytes,
+                "ts": utc_iso(),
             }
-            st.session_state["results"].append(meta)
+            append_result(meta)
         except Exception as e:
             st.exception(e)
 
@@ -139,52 +250,104 @@ st.divider()
 st.header("2) Hash de archivo (incremental con progreso)")
 uploaded = st.file_uploader("Sube un archivo (≤ límite de la barra lateral)", type=None)
 
-if uploaded is not None:
-    progress = st.progress(0.0)
-    status = st.empty()
+file_job = st.session_state.get("file_hash_job")
+file_job_running = file_job is not None and "future" in file_job and not file_job["future"].done()
+
+if uploaded is not None and st.button(
+    "Hashear archivo", use_container_width=True, disabled=file_job_running
+):
+    # Genera sal solo si está activado (una por archivo)
+    file_salt = generate_salt(salt_len) if use_salt else None
+    file_job = {
+        "size": uploaded.size,
+        "name": uploaded.name,
+        "algorithm": algorithm,
+        "with_pepper": bool(pepper_bytes),
+    }
+    # Con sal nueva por archivo el memo nunca acertaría: solo se usa sin sal.
+    if file_salt is None:
+        file_job["memo_key"] = (uploaded.file_id, algorithm, pepper_bytes, size_limit_bytes)
+        memo_hit = st.session_state["file_hash_memo"].get(file_job["memo_key"])
+    else:
+        memo_hit = None
 
-    processed_tracker = {"value": 0}
+    if memo_hit is not None:
+        file_job["result"] = memo_hit
+    else:
+        job_progress = {"value": 0}
 
-    def _on_progress(processed_bytes: int):
-        processed_tracker["value"] = processed_bytes
-        if uploaded.size:
-            progress.progress(min(processed_bytes / uploaded.size, 1.0))
-            status.write(f"Procesado: {processed_bytes} / {uploaded.size} bytes")
+        def _on_progress(processed_bytes: int):
+            # Se ejecuta en el hilo de trabajo: solo actualiza estado, sin widgets.
+            job_progress["value"] = processed_bytes
 
-    do_hash = st.button("Hashear archivo", use_container_width=True)
-    if do_hash:
-        # Genera sal solo si está activado (una por archivo)
-        file_salt = generate_salt(salt_len) if use_salt else None
-        try:
-            digest, salt_used, total_bytes = hash_file_chunked(
-                file_obj=uploaded,
-                algorithm=algorithm,
-                chunk_size=chunk_size,
-                salt=file_salt,
-                pepper=pepper_bytes,
-                progress_callback=_on_progress,
-                size_limit_bytes=size_limit_bytes,
-            )
-            st.success(f"Hash calculado ({total_bytes} bytes)")
-            st.code(digest, language="text")
-            if salt_used:
-                with st.expander("Sal utilizada (hex)"):
-                    st.code(salt_used.hex(), language="text")
-            meta = {
-                "type": "file",
-                "algorithm": algorithm,
-                "with_salt": bool(salt_used),
-                "salt_hex": salt_used.hex() if salt_used else "",
-                "with_pepper": bool(pepper_bytes),
-                "hmac": "",
-                "input_preview": uploaded.name,
-                "digest": digest,
-                "bytes": total_bytes,
-                "ts": datetime.utcnow().isoformat() + "Z",
-            }
-            st.session_state["results"].append(meta)
-        except Exception as e:
-            st.exception(e)
+        # hashlib libera el GIL durante update(), así que el hilo hashea en
+        # paralelo mientras los reruns siguen atendiendo a la UI.
+        file_job["future"] = get_hash_executor().submit(
+            hash_file_chunked,
+            file_obj=uploaded,
+            algorithm=algorithm,
+            chunk_size=chunk_size,
+            salt=file_salt,
+            pepper=pepper_bytes,
+            progress_callback=_on_progress,
+            size_limit_bytes=size_limit_bytes,
+        )
+        file_job["progress"] = job_progress
+        file_job_running = True
+    st.session_state["file_hash_job"] = file_job
+
+# Progreso/resultado en un fragment: mientras hay un trabajo en curso se
+# relanza solo este bloque cada FILE_JOB_POLL_SECONDS, sin tocar el resto de
+# secciones (ni borrar sus salidas puntuales).
+@st.fragment(run_every=FILE_JOB_POLL_SECONDS if file_job_running else None)
+def file_job_panel():
+    full_run = st.session_state.pop("file_panel_full_run", False)
+    file_job = st.session_state.get("file_hash_job")
+    if file_job is None:
+        return
+    if "future" in file_job and not file_job["future"].done():
+        processed_bytes = file_job["progress"]["value"]
+        if file_job["size"]:
+            st.progress(min(processed_bytes / file_job["size"], 1.0))
+        st.write(f"Procesado: {processed_bytes} / {file_job['size']} bytes")
+        return
+    if not full_run:
+        # El trabajo terminó durante el sondeo: rerun completo para dejar de
+        # sondear (run_every=None) y reactivar el botón; ahí se pinta el resultado.
+        st.rerun()
+
+    del st.session_state["file_hash_job"]
+    try:
+        if "result" in file_job:
+            digest, salt_used, total_bytes = file_job["result"]
+        else:
+            digest, salt_used, total_bytes = file_job["future"].result()
+            if "memo_key" in file_job:
+                remember_file_hash(file_job["memo_key"], (digest, salt_used, total_bytes))
+        st.progress(1.0)
+        st.success(f"Hash calculado ({total_bytes} bytes)")
+        st.code(digest, language="text")
+        if salt_used:
+            with st.expander("Sal utilizada (hex)"):
+                st.code(salt_used.hex(), language="text")
+        meta = {
+            "type": "file",
+            "algorithm": file_job["algorithm"],
+            "with_salt": bool(salt_used),
+            "salt_hex": salt_used.hex() if salt_used else "",
+            "with_pepper": file_job["with_pepper"],
+            "hmac": "",
+            "input_preview": file_job["name"],
+            "digest": digest,
+            "bytes": total_bytes,
+            "ts": utc_iso(),
+        }
+        append_result(meta)
+    except Exception as e:
+        st.exception(e)
+
+st.session_state["file_panel_full_run"] = True
+file_job_panel()
 
 st.divider()
 
@@ -210,7 +373,16 @@ st.divider()
 # --------- 4) HMAC ---------
 st.header("4) HMAC (autenticación de mensaje)")
 msg = st.text_area("Mensaje para HMAC", value="", height=100, placeholder="Texto del mensaje...")
-algo_hmac = st.selectbox("Algoritmo HMAC", options=SUPPORTED_ALGOS, index=SUPPORTED_ALGOS.index("sha256"))
+algo_hmac = st.selectbox(
+    "Algoritmo HMAC",
+    options=SUPPORTED_ALGOS,
+    index=SUPPORTED_ALGOS.index("sha256"),
+    format_func=algo_label,
+)
+if algo_hmac == "blake2b":
+    st.caption("Con blake2b el MAC es BLAKE2b con clave (modo nativo, RFC 7693), no HMAC-BLAKE2b.")
+elif algo_hmac == "blake3":
+    st.caption("Con blake3 el MAC es BLAKE3 en modo con clave (keyed), no HMAC.")
 if st.button("Calcular HMAC", use_container_width=True):
     if not msg:
         st.error("Introduce un mensaje.")
@@ -218,10 +390,10 @@ if st.button("Calcular HMAC", use_container_width=True):
         st.error("Configura `HMAC_KEY` en `st.secrets` para usar HMAC.")
     else:
         try:
-            mac = hmac_text(msg, key=hmac_key_bytes, algorithm=algo_hmac)
+            mac, total_bytes = hmac_text(msg, key=hmac_key_bytes, algorithm=algo_hmac)
             st.success("HMAC calculado")
             st.code(mac, language="text")
-            st.session_state["results"].append(
+            append_result(
                 {
                     "type": "hmac",
                     "algorithm": algo_hmac,
@@ -229,10 +401,10 @@ if st.button("Calcular HMAC", use_container_width=True):
                     "salt_hex": "",
                     "with_pepper": False,
                     "hmac": "yes",
-                    "input_preview": msg[:30].replace("\n", " ") + ("..." if len(msg) > 30 else ""),
+                    "input_preview": input_preview(msg),
                     "digest": mac,
-                    "bytes": len(msg.encode("utf-8")),
-                    "ts": datetime.utcnow().isoformat() + "Z",
+                    "bytes": total_bytes,
+                    "ts": utc_iso(),
                 }
             )
         except Exception as e:
@@ -242,32 +414,27 @@ st.divider()
 
 # --------- 5) Descarga de resultados (CSV) ---------
 st.header("5) Descarga de resultados (CSV)")
-if st.session_state["results"]:
-    # Generamos CSV en memoria
-    output = io.StringIO()
-    writer = csv.DictWriter(
-        output,
-        fieldnames=[
-            "ts",
-            "type",
-            "algorithm",
-            "with_salt",
-            "salt_hex",
-            "with_pepper",
-            "hmac",
-            "input_preview",
-            "digest",
-            "bytes",
-        ],
-    )
-    writer.writeheader()
-    for row in st.session_state["results"]:
-        writer.writerow(row)
-    csv_bytes = output.getvalue().encode("utf-8")
+n_results = len(st.session_state["results_cols"]["ts"])
+if n_results and st.button("Limpiar resultados", use_container_width=True):
+    st.session_state["results_cols"] = {field: [] for field in CSV_FIELDS}
+    n_results = 0
+    st.session_state["csv_buf"] = bytearray()
+    st.session_state["csv_len"] = 0
+
+if n_results:
+    # CSV incremental: los resultados solo se añaden, así que serializamos
+    # únicamente las filas nuevas desde el último rerun.
+    csv_buf = st.session_state["csv_buf"]
+    if st.session_state["csv_len"] == 0:
+        csv_buf += _CSV_HEADER
+    if st.session_state["csv_len"] < n_results:
+        csv_buf += _csv_rows(st.session_state["results_cols"], st.session_state["csv_len"])
+    st.session_state["csv_len"] = n_results
+    csv_bytes = bytes(csv_buf)
     st.download_button(
         label="Descargar CSV",
         data=csv_bytes,
-        file_name=f"hash_results_{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}.csv",
+        file_name=f"hash_results_{utc_iso().replace(':', '').replace('-', '')[:15]}Z.csv",
         mime="text/csv",
         use_container_width=True,
     )